@@ -1,16 +1,69 @@
+import functools
 import json
+import math
+import time
 import numpy as np
 import pandas as pd
+from numba import njit
+import shapely
 from shapely.geometry import Polygon
-import plotly.express as px
 import plotly.graph_objects as go
-from dash import Dash, html, dcc, Input, Output, State, callback_context
+import plotly.io as pio
+from plotly.subplots import make_subplots
+from plotly.colors import get_colorscale
+from dash import Dash, html, dcc, Input, Output, State, Patch, callback_context
 import dash_bootstrap_components as dbc
+from flask_caching import Cache
 
 # ===============================================================
 # Helper: generate hex grid clipped by polygon
 # ===============================================================
-def generate_hex_grid_from_geojson(geojson_data, hex_size=0.001):
+# Unit offsets of a flat-top hexagon, closed ring (first vertex repeated)
+HEX_ANGLES = np.deg2rad([0, 60, 120, 180, 240, 300, 0])
+HEX_UNIT = np.stack([np.cos(HEX_ANGLES), np.sin(HEX_ANGLES)], axis=1)
+
+# Single seeded generator for all simulated readings
+RNG = np.random.default_rng(42)
+
+
+@njit(cache=True)
+def _hex_centers(min_lon, max_lon, min_lat, max_lat, hex_width, hex_height):
+    ncols = int(math.ceil((max_lon + hex_width - min_lon) / hex_width))
+    nrows = int(math.ceil((max_lat + hex_height - min_lat) / hex_height))
+    lons = np.empty(ncols * nrows)
+    lats = np.empty(ncols * nrows)
+    k = 0
+    for col in range(ncols):
+        lat_shift = 0.5 * hex_height if col % 2 == 1 else 0.0
+        for row in range(nrows):
+            lons[k] = min_lon + col * hex_width
+            lats[k] = min_lat + row * hex_height + lat_shift
+            k += 1
+    return lons, lats
+
+
+@njit(cache=True)
+def _pip_mask(cx, cy, poly_x, poly_y):
+    # Even-odd ray casting of every center against a single ring
+    n = cx.size
+    m = poly_x.size
+    out = np.empty(n, np.bool_)
+    for i in range(n):
+        x = cx[i]
+        y = cy[i]
+        inside = False
+        j = m - 1
+        for k in range(m):
+            if (poly_y[k] > y) != (poly_y[j] > y):
+                x_cross = poly_x[k] + (y - poly_y[k]) * (poly_x[j] - poly_x[k]) / (poly_y[j] - poly_y[k])
+                if x < x_cross:
+                    inside = not inside
+            j = k
+        out[i] = inside
+    return out
+
+
+def build_hex_geometry(geojson_data, hex_size=0.001):
     polygon_coords = geojson_data['features'][0]['geometry']['coordinates'][0]
     polygon_shape = Polygon(polygon_coords)
 
@@ -18,66 +71,112 @@ def generate_hex_grid_from_geojson(geojson_data, hex_size=0.001):
     hex_width = 1.5 * hex_size
     hex_height = np.sqrt(3) * hex_size
 
-    lon_points, lat_points = [], []
-    col = 0
-    lon = min_lon
-    while lon < max_lon + hex_width:
-        lat = min_lat
-        while lat < max_lat + hex_height:
-            lat_shift = (0.5 * hex_height) if col % 2 == 1 else 0
-            lon_points.append(lon)
-            lat_points.append(lat + lat_shift)
-            lat += hex_height
-        lon += hex_width
-        col += 1
-
-    def hexagon_flat(center_lon, center_lat, size):
-        angles = np.deg2rad([0, 60, 120, 180, 240, 300, 0])
-        return [(center_lon + size * np.cos(a), center_lat + size * np.sin(a)) for a in angles]
-
-    features, centers, temp_values, hum_values, co2_values, battery_values, smoke_values = [], [], [], [], [], [], []
-    grid_id = 0
-    for center_lon, center_lat in zip(lon_points, lat_points):
-        hex_coords = hexagon_flat(center_lon, center_lat, hex_size)
-        hex_poly = Polygon(hex_coords)
-        inter = hex_poly.intersection(polygon_shape)
-        if not inter.is_empty and inter.area / hex_poly.area > 0.5:
-            features.append({
-                "type": "Feature",
-                "geometry": {"type": "Polygon", "coordinates": [list(hex_poly.exterior.coords)]},
-                "properties": {"grid_id": grid_id, "center_lon": center_lon, "center_lat": center_lat}
-            })
-            centers.append((center_lat, center_lon))
-            temp_values.append(25 + np.random.randn() * 3 + (grid_id % 5))
-            hum_values.append(60 + np.random.randn() * 5 - (grid_id % 3))
-            co2_values.append(350 + np.random.randn() * 10 + (grid_id % 7) * 5)
-            smoke_values.append(np.random.randint(10, 100))
-            battery_values.append(np.random.randint(20, 100))
-            grid_id += 1
+    lon_points, lat_points = _hex_centers(min_lon, max_lon, min_lat, max_lat, hex_width, hex_height)
+    centers_xy = np.stack([lon_points, lat_points], axis=1)
+    verts = centers_xy[:, None, :] + hex_size * HEX_UNIT[None, :, :]
+
+    # Cells whose center is more than one hex radius from the boundary lie
+    # entirely inside or outside it; only the rest need an exact clip
+    boundary = np.asarray(polygon_coords, dtype=np.float64)
+    inside = _pip_mask(centers_xy[:, 0], centers_xy[:, 1], boundary[:, 0], boundary[:, 1])
+    near_edge = shapely.distance(polygon_shape.boundary, shapely.points(centers_xy)) < hex_size
+
+    accepted = inside & ~near_edge
+    edge_polys = shapely.polygons(verts[near_edge])
+    edge_overlap = shapely.area(shapely.intersection(edge_polys, polygon_shape)) / shapely.area(edge_polys)
+    accepted[near_edge] = edge_overlap > 0.5
+
+    centers = centers_xy[accepted]
+    grid_ids = np.arange(len(centers))
+    # Convert the accepted rings and centers to Python floats in one pass each
+    features = [
+        {
+            "type": "Feature",
+            "geometry": {"type": "Polygon", "coordinates": [ring]},
+            "properties": {"grid_id": grid_id, "center_lon": center_lon, "center_lat": center_lat}
+        }
+        for grid_id, (ring, (center_lon, center_lat)) in enumerate(zip(verts[accepted].tolist(), centers.tolist()))
+    ]
 
     grid_geojson = {"type": "FeatureCollection", "features": features}
+    return grid_geojson, centers, grid_ids, polygon_coords
+
+
+@functools.lru_cache(maxsize=4)
+def load_hex_geometry(hex_size=0.001):
+    # The grid only depends on the static boundary, so build it once per hex size
+    with open("map.geojson", "r", encoding="utf-8") as f:
+        geojson_data = json.load(f)
+    return build_hex_geometry(geojson_data, hex_size)
+
+
+def sample_sensor_values(n, rng=RNG):
+    ids = np.arange(n)
+    # Readings only need display precision; smoke and battery fit in a byte
+    return {
+        "temperature": np.round(25 + rng.standard_normal(n) * 3 + (ids % 5), 2).astype(np.float32),
+        "humidity": np.round(60 + rng.standard_normal(n) * 5 - (ids % 3), 2).astype(np.float32),
+        "co2": np.round(350 + rng.standard_normal(n) * 10 + (ids % 7) * 5, 2).astype(np.float32),
+        "smoke": rng.integers(10, 100, n, dtype=np.uint8),
+        "battery": rng.integers(20, 100, n, dtype=np.uint8),
+    }
+
+
+# Simulated 30-day history: the time axis and seasonal shape are shared by all
+# sensors, only the base reading and noise differ per click
+HISTORY_DAYS = 30
+HISTORY_SIN = np.sin(np.arange(HISTORY_DAYS) / 3) * 2
+HISTORY_COS = np.cos(np.arange(HISTORY_DAYS) / 4) * 3
+
+
+@functools.lru_cache(maxsize=1)
+def history_dates(end):
+    return pd.date_range(end=end, periods=HISTORY_DAYS)
+
+
+def generate_sensor_grid(hex_size=0.001):
+    _, centers, grid_ids, _ = load_hex_geometry(hex_size)
     df_grid = pd.DataFrame({
-        "grid_id": list(range(grid_id)),
-        "temperature": np.round(temp_values, 2),
-        "humidity": np.round(hum_values, 2),
-        "co2": np.round(co2_values, 2),
-        "smoke": smoke_values,
-        "battery": battery_values,
-        "center_lat": [c[0] for c in centers],
-        "center_lon": [c[1] for c in centers]
-    })
-    return df_grid, grid_geojson, polygon_coords
+        "grid_id": grid_ids,
+        **sample_sensor_values(len(grid_ids)),
+        "center_lat": centers[:, 1],
+        "center_lon": centers[:, 0]
+    }, copy=False)
+    return df_grid
 
 
 # ===============================================================
 # App init
 # ===============================================================
+# Dash serializes every callback response (figures included) through plotly.io
+pio.json.config.default_engine = "orjson"
+
 app = Dash(__name__, 
            title="Forest Fire Monitor - Sơn Trà",
            external_stylesheets=[dbc.themes.CYBORG],
            suppress_callback_exceptions=True)
 server = app.server
 
+REFRESH_SECONDS = 30
+
+# Keep each set of sampled readings in-process instead of round-tripping it
+# through dcc.Store as JSON. update_map keys snapshots by wall-clock refresh
+# epoch and stores only that key, so every client sees the same fresh readings
+# and the map, insights and detail panels agree. Only the DataFrame is cached
+# (SimpleCache pickles every entry); the static geometry comes from
+# load_hex_geometry. SimpleCache is per process, so this assumes a single worker.
+cache = Cache(server, config={"CACHE_TYPE": "SimpleCache"})
+
+
+def current_grid_key():
+    return int(time.time() // REFRESH_SECONDS)
+
+
+@cache.memoize(timeout=4 * REFRESH_SECONDS)
+def get_grid(grid_key):
+    return generate_sensor_grid()
+
+
 app.layout = dbc.Container(fluid=True, className="main-container", children=[
     # Header
     dbc.Row([
@@ -94,8 +193,9 @@ app.layout = dbc.Container(fluid=True, className="main-container", children=[
     
     # Store components
     dcc.Store(id="grid-store"),
+    dcc.Store(id="filter-state", data="temperature"),
     dcc.Store(id="selected-sensor"),
-    dcc.Interval(id="refresh-interval", interval=30000, n_intervals=0),
+    dcc.Interval(id="refresh-interval", interval=REFRESH_SECONDS * 1000, n_intervals=0),
     
     # Tab content
     html.Div(id="tab-content")
@@ -205,34 +305,85 @@ def render_tab_content(active_tab):
         ])
 
 
-@app.callback(
-    Output("map-chart", "figure"),
-    Output("grid-store", "data"),
+# Filter buttons only update the selected metric in the browser, so update_map
+# has a single filter input instead of five n_clicks inputs
+app.clientside_callback(
+    """
+    function(tempClicks, humClicks, co2Clicks, smokeClicks, batteryClicks, current) {
+        const filterMap = {
+            "filter-temp": "temperature",
+            "filter-hum": "humidity",
+            "filter-co2": "co2",
+            "filter-smoke": "smoke",
+            "filter-battery": "battery"
+        };
+        const triggered = dash_clientside.callback_context.triggered;
+        const filterBy = triggered.length ? filterMap[triggered[0].prop_id.split(".")[0]] : undefined;
+        if (!filterBy || filterBy === current) {
+            return dash_clientside.no_update;
+        }
+        return filterBy;
+    }
+    """,
+    Output("filter-state", "data"),
     Input("filter-temp", "n_clicks"),
     Input("filter-hum", "n_clicks"),
     Input("filter-co2", "n_clicks"),
     Input("filter-smoke", "n_clicks"),
     Input("filter-battery", "n_clicks"),
-    Input("refresh-interval", "n_intervals")
+    State("filter-state", "data"),
+    prevent_initial_call=True
 )
-def update_map(temp_clicks, hum_clicks, co2_clicks, smoke_clicks, battery_clicks, n_intervals):
-    ctx = callback_context
-    if not ctx.triggered:
-        filter_by = "temperature"
-    else:
-        button_id = ctx.triggered[0]["prop_id"].split(".")[0]
-        filter_map = {
-            "filter-temp": "temperature",
-            "filter-hum": "humidity",
-            "filter-co2": "co2",
-            "filter-smoke": "smoke",
-            "filter-battery": "battery"
+
+
+# Switching the metric only swaps z, the colorscale and the colorbar title of
+# the hex trace; every metric is already in customdata, so do it in the browser
+app.clientside_callback(
+    """
+    function(filterBy, figure) {
+        if (!figure || !figure.data || !figure.layout.meta) {
+            return dash_clientside.no_update;
         }
-        filter_by = filter_map.get(button_id, "temperature")
-    
-    with open("map.geojson", "r", encoding="utf-8") as f:
-        geojson_data = json.load(f)
-    df_grid, grid_geojson, polygon_coords = generate_hex_grid_from_geojson(geojson_data)
+        const metric = figure.layout.meta.metrics[filterBy];
+        const trace = figure.data[0];
+        const newTrace = Object.assign({}, trace, {
+            z: trace.customdata.map(row => row[metric.index]),
+            colorscale: metric.colorscale,
+            colorbar: Object.assign({}, trace.colorbar, {title: {text: metric.title}})
+        });
+        return Object.assign({}, figure, {data: [newTrace].concat(figure.data.slice(1))});
+    }
+    """,
+    Output("map-chart", "figure", allow_duplicate=True),
+    Input("filter-state", "data"),
+    State("map-chart", "figure"),
+    prevent_initial_call=True
+)
+
+
+@app.callback(
+    Output("map-chart", "figure"),
+    Output("grid-store", "data"),
+    Input("refresh-interval", "n_intervals"),
+    State("filter-state", "data")
+)
+def update_map(n_intervals, filter_by):
+    grid_key = current_grid_key()
+    df_grid = get_grid(grid_key)
+
+    # Column order of customdata; the clientside filter callback reads z from it
+    metric_columns = ["grid_id", "temperature", "humidity", "co2", "smoke", "battery"]
+    # Round after widening so float32 columns serialize as short decimals
+    metric_values = np.round(df_grid[metric_columns].to_numpy(np.float64), 2)
+    customdata = metric_values.tolist()
+    z = metric_values[:, metric_columns.index(filter_by)].tolist()
+
+    # The hex geometry and layout are static, so a refresh only pushes the new values
+    if callback_context.triggered_id == "refresh-interval":
+        patched_fig = Patch()
+        patched_fig["data"][0]["z"] = z
+        patched_fig["data"][0]["customdata"] = customdata
+        return patched_fig, grid_key
 
     color_scales = {
         "temperature": "Reds",
@@ -250,44 +401,43 @@ def update_map(temp_clicks, hum_clicks, co2_clicks, smoke_clicks, battery_clicks
         "battery": "Pin (%)"
     }
 
-    fig = px.choropleth(
-        df_grid, geojson=grid_geojson, locations="grid_id", color=filter_by,
-        featureidkey="properties.grid_id", 
-        color_continuous_scale=color_scales[filter_by],
-        labels={filter_by: titles[filter_by]}
+    # Let Plotly format the hover text from customdata instead of building one string per row
+    hover_template = (
+        "<b>Sensor #%{customdata[0]}</b><br>"
+        "🌡️ Nhiệt độ: %{customdata[1]:.1f}°C<br>"
+        "💧 Độ ẩm: %{customdata[2]:.1f}%<br>"
+        "🏭 CO₂: %{customdata[3]:.0f} ppm<br>"
+        "💨 Khói: %{customdata[4]}<br>"
+        "🔋 Pin: %{customdata[5]}%<br>"
+        "<extra></extra>"
     )
-
-    # Build hover data arrays
-    hover_data = []
-    for _, row in df_grid.iterrows():
-        hover_text = (
-            f"<b>Sensor #{int(row['grid_id'])}</b><br>" +
-            f"🌡️ Nhiệt độ: {row['temperature']:.1f}°C<br>" +
-            f"💧 Độ ẩm: {row['humidity']:.1f}%<br>" +
-            f"🏭 CO₂: {row['co2']:.0f} ppm<br>" +
-            f"💨 Khói: {row['smoke']}<br>" +
-            f"🔋 Pin: {row['battery']}%<br>" +
-            "<extra></extra>"
-        )
-        hover_data.append(hover_text)
     
-    fig.update_traces(
+    grid_geojson, _, _, polygon_coords = load_hex_geometry()
+    
+    # Tile (WebGL) map instead of the SVG geo subplot, which is slow for dense hex overlays
+    fig = go.Figure(go.Choroplethmap(
+        geojson=grid_geojson,
+        locations=df_grid["grid_id"],
+        z=z,
+        featureidkey="properties.grid_id",
+        colorscale=color_scales[filter_by],
         marker_line_width=0.5,
         marker_line_color='rgba(255,255,255,0.3)',
-        hovertemplate=hover_data,
-        customdata=df_grid[["grid_id"]].values
-    )
-    
-    fig.update_geos(
-        fitbounds="locations", 
-        visible=False, 
-        bgcolor="#1a1a1a"
-    )
+        hovertemplate=hover_template,
+        customdata=customdata,
+        colorbar=dict(
+            title=titles[filter_by],
+            thickness=15,
+            len=0.7
+        )
+    ))
     
     # Add boundary
-    fig.add_trace(go.Scattergeo(
-        lon=[p[0] for p in polygon_coords], 
-        lat=[p[1] for p in polygon_coords],
+    boundary_lon = [p[0] for p in polygon_coords]
+    boundary_lat = [p[1] for p in polygon_coords]
+    fig.add_trace(go.Scattermap(
+        lon=boundary_lon, 
+        lat=boundary_lat,
         mode="lines", 
         line=dict(width=2, color="#00d4ff"),
         name="Ranh giới",
@@ -295,20 +445,34 @@ def update_map(temp_clicks, hum_clicks, co2_clicks, smoke_clicks, battery_clicks
         hoverinfo='skip'
     ))
     
+    # Fit the boundary's bounding box (tile maps have no fitbounds): at zoom z the
+    # 360° world is 256 * 2**z px wide. Assume a map panel of at least ~512 px
+    # across and weight the latitude span for the panel's shorter height.
+    span = max(max(boundary_lon) - min(boundary_lon), (max(boundary_lat) - min(boundary_lat)) * 1.5)
+    map_zoom = math.log2(360 / span * 512 / 256)
+    
     fig.update_layout(
+        map_style="carto-darkmatter",
+        map_zoom=map_zoom,
+        map_center=dict(
+            lon=(min(boundary_lon) + max(boundary_lon)) / 2,
+            lat=(min(boundary_lat) + max(boundary_lat)) / 2
+        ),
         paper_bgcolor="#1a1a1a",
-        plot_bgcolor="#1a1a1a",
         font_color="white",
         margin=dict(l=0, r=0, t=0, b=0),
         clickmode='event+select',
-        coloraxis_colorbar=dict(
-            title=titles[filter_by],
-            thickness=15,
-            len=0.7
-        )
+        meta=dict(metrics={
+            metric: dict(
+                index=metric_columns.index(metric),
+                colorscale=get_colorscale(color_scales[metric]),
+                title=titles[metric]
+            )
+            for metric in color_scales
+        })
     )
     
-    return fig, df_grid.to_json(orient="split")
+    return fig, grid_key
 
 
 @app.callback(
@@ -318,45 +482,53 @@ def update_map(temp_clicks, hum_clicks, co2_clicks, smoke_clicks, battery_clicks
     Output("statistics-summary", "children"),
     Input("grid-store", "data")
 )
-def update_insights(grid_json):
-    if not grid_json:
+def update_insights(grid_key):
+    if grid_key is None:
         return "Đang tải...", "Đang tải...", "Đang tải...", "Đang tải..."
     
-    df = pd.read_json(grid_json, orient="split")
+    df = get_grid(grid_key)
+    
+    # Work on the column arrays directly instead of building masked DataFrames
+    grid_ids = df["grid_id"].to_numpy()
+    temp = df["temperature"].to_numpy()
+    hum = df["humidity"].to_numpy()
+    co2 = df["co2"].to_numpy()
+    smoke = df["smoke"].to_numpy()
+    battery = df["battery"].to_numpy()
     
-    # Critical Alerts
+    # Critical Alerts (if any reading is over the threshold, the overall max is too)
     critical = []
-    high_temp = df[df["temperature"] > 32]
-    high_co2 = df[df["co2"] > 400]
-    high_smoke = df[df["smoke"] > 70]
+    n_high_temp = int(np.count_nonzero(temp > 32))
+    n_high_co2 = int(np.count_nonzero(co2 > 400))
+    n_high_smoke = int(np.count_nonzero(smoke > 70))
     
-    if len(high_temp) > 0:
-        top_sensor = high_temp.nlargest(1, "temperature").iloc[0]
+    if n_high_temp > 0:
+        top = int(np.argmax(temp))
         critical.append(
             dbc.Alert([
-                html.Strong(f"🔥 {len(high_temp)} sensor nhiệt độ cao (>32°C)"),
+                html.Strong(f"🔥 {n_high_temp} sensor nhiệt độ cao (>32°C)"),
                 html.Br(),
-                html.Small(f"Cao nhất: Sensor #{int(top_sensor['grid_id'])} - {top_sensor['temperature']:.1f}°C")
+                html.Small(f"Cao nhất: Sensor #{int(grid_ids[top])} - {temp[top]:.1f}°C")
             ], color="danger", className="mb-2 py-2")
         )
     
-    if len(high_co2) > 0:
-        top_sensor = high_co2.nlargest(1, "co2").iloc[0]
+    if n_high_co2 > 0:
+        top = int(np.argmax(co2))
         critical.append(
             dbc.Alert([
-                html.Strong(f"🏭 {len(high_co2)} sensor CO₂ cao (>400ppm)"),
+                html.Strong(f"🏭 {n_high_co2} sensor CO₂ cao (>400ppm)"),
                 html.Br(),
-                html.Small(f"Cao nhất: Sensor #{int(top_sensor['grid_id'])} - {top_sensor['co2']:.0f}ppm")
+                html.Small(f"Cao nhất: Sensor #{int(grid_ids[top])} - {co2[top]:.0f}ppm")
             ], color="warning", className="mb-2 py-2")
         )
     
-    if len(high_smoke) > 0:
-        top_sensor = high_smoke.nlargest(1, "smoke").iloc[0]
+    if n_high_smoke > 0:
+        top = int(np.argmax(smoke))
         critical.append(
             dbc.Alert([
-                html.Strong(f"💨 {len(high_smoke)} sensor phát hiện khói (>70)"),
+                html.Strong(f"💨 {n_high_smoke} sensor phát hiện khói (>70)"),
                 html.Br(),
-                html.Small(f"Cao nhất: Sensor #{int(top_sensor['grid_id'])} - {top_sensor['smoke']}")
+                html.Small(f"Cao nhất: Sensor #{int(grid_ids[top])} - {smoke[top]}")
             ], color="warning", className="mb-2 py-2")
         )
     
@@ -368,31 +540,35 @@ def update_insights(grid_json):
             ], color="success", className="py-2")
         )
     
-    # Top Temperature
-    top_temp = df.nlargest(5, "temperature")
+    # Top Temperature: partial selection instead of a full sort
+    top_idx = np.argpartition(temp, -5)[-5:] if len(temp) > 5 else np.arange(len(temp))
+    top_idx = top_idx[np.argsort(temp[top_idx])[::-1]]
     temp_items = [
         dbc.ListGroupItem([
             html.Div([
-                html.Strong(f"Sensor #{int(row['grid_id'])}", className="me-2"),
-                html.Span(f"{row['temperature']:.1f}°C", className="float-end badge bg-danger")
+                html.Strong(f"Sensor #{int(grid_ids[i])}", className="me-2"),
+                html.Span(f"{temp[i]:.1f}°C", className="float-end badge bg-danger")
             ]),
-            dbc.Progress(value=min(row['temperature'], 40), max=40, color="danger", className="mt-2", style={"height": "6px"})
+            dbc.Progress(value=min(temp[i], 40), max=40, color="danger", className="mt-2", style={"height": "6px"})
         ], className="py-2")
-        for _, row in top_temp.iterrows()
+        for i in top_idx
     ]
     
     # Low Battery
-    low_batt = df[df["battery"] < 30].sort_values("battery")
-    if len(low_batt) > 0:
+    low_idx = np.flatnonzero(battery < 30)
+    if len(low_idx) > 0:
+        if len(low_idx) > 5:
+            low_idx = low_idx[np.argpartition(battery[low_idx], 4)[:5]]
+        low_idx = low_idx[np.argsort(battery[low_idx])]
         batt_items = [
             dbc.ListGroupItem([
                 html.Div([
-                    html.Strong(f"Sensor #{int(row['grid_id'])}", className="me-2"),
-                    html.Span(f"{row['battery']}%", className="float-end badge bg-warning text-dark")
+                    html.Strong(f"Sensor #{int(grid_ids[i])}", className="me-2"),
+                    html.Span(f"{battery[i]}%", className="float-end badge bg-warning text-dark")
                 ]),
-                dbc.Progress(value=row['battery'], max=100, color="warning", className="mt-2", style={"height": "6px"})
+                dbc.Progress(value=battery[i], max=100, color="warning", className="mt-2", style={"height": "6px"})
             ], className="py-2")
-            for _, row in low_batt.head(5).iterrows()
+            for i in low_idx
         ]
     else:
         batt_items = [
@@ -407,25 +583,25 @@ def update_insights(grid_json):
         dbc.Col([
             html.Div([
                 html.Small("Nhiệt độ TB", className="text-muted d-block mb-1"),
-                html.H5(f"{df['temperature'].mean():.1f}°C", className="mb-0 text-danger")
+                html.H5(f"{temp.mean():.1f}°C", className="mb-0 text-danger")
             ], className="stat-box text-center")
         ], xs=6, className="mb-2"),
         dbc.Col([
             html.Div([
                 html.Small("Độ ẩm TB", className="text-muted d-block mb-1"),
-                html.H5(f"{df['humidity'].mean():.1f}%", className="mb-0 text-info")
+                html.H5(f"{hum.mean():.1f}%", className="mb-0 text-info")
             ], className="stat-box text-center")
         ], xs=6, className="mb-2"),
         dbc.Col([
             html.Div([
                 html.Small("CO₂ TB", className="text-muted d-block mb-1"),
-                html.H5(f"{df['co2'].mean():.0f}ppm", className="mb-0 text-success")
+                html.H5(f"{co2.mean():.0f}ppm", className="mb-0 text-success")
             ], className="stat-box text-center")
         ], xs=6, className="mb-2"),
         dbc.Col([
             html.Div([
                 html.Small("Tổng sensor", className="text-muted d-block mb-1"),
-                html.H5(f"{len(df)}", className="mb-0 text-warning")
+                html.H5(f"{len(grid_ids)}", className="mb-0 text-warning")
             ], className="stat-box text-center")
         ], xs=6, className="mb-2"),
     ], className="g-2")
@@ -440,8 +616,8 @@ def update_insights(grid_json):
     Input("map-chart", "clickData"),
     Input("grid-store", "data")
 )
-def show_sensor_detail(clickData, grid_json):
-    if not clickData or not grid_json:
+def show_sensor_detail(clickData, grid_key):
+    if not clickData or grid_key is None:
         return None, "", html.Div([
             html.Div([
                 html.I(className="fas fa-mouse-pointer", style={"fontSize": "48px", "color": "#6c757d"}),
@@ -475,7 +651,7 @@ def show_sensor_detail(clickData, grid_json):
             ], className="text-center py-5")
         ])
     
-    df = pd.read_json(grid_json, orient="split")
+    df = get_grid(grid_key)
     sensor = df[df["grid_id"] == grid_id].iloc[0]
     
     # Header info
@@ -489,61 +665,52 @@ def show_sensor_detail(clickData, grid_json):
     ])
     
     # Detailed charts
-    days = pd.date_range(end=pd.Timestamp.today(), periods=30)
+    days = history_dates(pd.Timestamp.today().normalize())
     base_temp = sensor['temperature']
     base_hum = sensor['humidity']
     base_co2 = sensor['co2']
     
     history = pd.DataFrame({
         "Ngày": days,
-        "Nhiệt độ": base_temp + np.sin(np.arange(30)/3) * 2 + np.random.normal(0, 0.5, 30),
-        "Độ ẩm": base_hum + np.cos(np.arange(30)/4) * 3 + np.random.normal(0, 1, 30),
-        "CO₂": base_co2 + np.random.normal(0, 5, 30),
-        "Khói": sensor['smoke'] + np.random.randint(-10, 10, 30)
+        "Nhiệt độ": base_temp + HISTORY_SIN + RNG.normal(0, 0.5, HISTORY_DAYS),
+        "Độ ẩm": base_hum + HISTORY_COS + RNG.normal(0, 1, HISTORY_DAYS),
+        "CO₂": base_co2 + RNG.normal(0, 5, HISTORY_DAYS),
+        "Khói": sensor['smoke'] + RNG.integers(-10, 10, HISTORY_DAYS)
     })
     
-    chart_layout = dict(
+    charts = [
+        ("Nhiệt độ", "📈 Nhiệt độ 30 ngày", "#ff6b6b"),
+        ("Độ ẩm", "💧 Độ ẩm 30 ngày", "#4ecdc4"),
+        ("CO₂", "🏭 CO₂ 30 ngày", "#95e1d3"),
+        ("Khói", "💨 Khói 30 ngày", "#ffd93d"),
+    ]
+    
+    # One 2x2 figure instead of four separate px.line figures
+    fig = make_subplots(rows=2, cols=2, subplot_titles=[title for _, title, _ in charts],
+                        vertical_spacing=0.18, horizontal_spacing=0.08)
+    for i, (column, _, color) in enumerate(charts):
+        fig.add_trace(
+            go.Scatter(x=history["Ngày"], y=history[column], mode="lines", line_color=color,
+                       showlegend=False, hovertemplate=f"Ngày=%{{x}}<br>{column}=%{{y}}<extra></extra>"),
+            row=i // 2 + 1, col=i % 2 + 1
+        )
+    
+    fig.update_layout(
         paper_bgcolor="#2a2a2a", 
         plot_bgcolor="#2a2a2a", 
         font_color="white", 
-        height=250,
+        height=520,
         margin=dict(l=40, r=20, t=40, b=40)
     )
     
-    detail_content = dbc.Row([
-        dbc.Col([
-            dcc.Graph(
-                figure=px.line(history, x="Ngày", y="Nhiệt độ", title="📈 Nhiệt độ 30 ngày")
-                .update_layout(**chart_layout)
-                .update_traces(line_color="#ff6b6b"),
-                config={"displayModeBar": False}
-            )
-        ], lg=6, md=12, className="mb-3"),
-        dbc.Col([
-            dcc.Graph(
-                figure=px.line(history, x="Ngày", y="Độ ẩm", title="💧 Độ ẩm 30 ngày")
-                .update_layout(**chart_layout)
-                .update_traces(line_color="#4ecdc4"),
-                config={"displayModeBar": False}
-            )
-        ], lg=6, md=12, className="mb-3"),
-        dbc.Col([
-            dcc.Graph(
-                figure=px.line(history, x="Ngày", y="CO₂", title="🏭 CO₂ 30 ngày")
-                .update_layout(**chart_layout)
-                .update_traces(line_color="#95e1d3"),
-                config={"displayModeBar": False}
-            )
-        ], lg=6, md=12, className="mb-3"),
-        dbc.Col([
-            dcc.Graph(
-                figure=px.line(history, x="Ngày", y="Khói", title="💨 Khói 30 ngày")
-                .update_layout(**chart_layout)
-                .update_traces(line_color="#ffd93d"),
-                config={"displayModeBar": False}
-            )
-        ], lg=6, md=12, className="mb-3"),
-    ], className="g-2")
+    # Unlike the old lg=6/md=12 columns, the fused 2x2 figure cannot stack on
+    # narrow screens; give it a minimum width and let the card scroll sideways
+    # instead of squeezing each chart, in exchange for one figure per click
+    detail_content = html.Div(
+        dcc.Graph(figure=fig, config={"displayModeBar": False}, responsive=True,
+                  style={"minWidth": "640px", "height": "520px"}),
+        style={"overflowX": "auto"}
+    )
     
     return grid_id, header_info, detail_content
 